@@ -5,20 +5,160 @@
 1. Entry points (pip пакеты)
 2. Локальные папки (для разработки)
 """
+import contextvars
 import importlib
 import importlib.metadata
 import importlib.util
+import inspect
 import logging
+import os
+import sys
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import Future, wait
+from functools import cache
+from itertools import chain
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Type
+from types import MappingProxyType, ModuleType
+from typing import Callable, Dict, FrozenSet, List, Mapping, Optional, Any, Tuple, Type
 
 from flask import Flask
 
-from .plugin import ExpotionPlugin
+from .plugin import ExpotionPlugin, _collect_subclasses
 
 logger = logging.getLogger(__name__)
 
 ENTRY_POINT_GROUP = "expotion.plugins"
+HEALTHCHECK_TIMEOUT = 5.0
+
+
+@cache
+def _cached_entry_points() -> Tuple[importlib.metadata.EntryPoint, ...]:
+    """Возвращает entry points группы плагинов (кешируется на процесс)."""
+    entry_points = importlib.metadata.entry_points()
+    
+    if hasattr(entry_points, 'select'):
+        return tuple(entry_points.select(group=ENTRY_POINT_GROUP))
+    return tuple(entry_points.get(ENTRY_POINT_GROUP, ()))
+
+
+# Уже импортированные локальные модули: путь к файлу -> (имя модуля, классы плагинов).
+_local_plugin_modules: Dict[str, Tuple[str, List[Type[ExpotionPlugin]]]] = {}
+_local_plugins_lock = threading.RLock()
+
+
+def _module_file(module: Optional[ModuleType]) -> Optional[str]:
+    """Возвращает абсолютный путь к файлу модуля, если он есть."""
+    path = getattr(module, '__file__', None)
+    return os.path.realpath(path) if path else None
+
+
+def _find_plugin_classes(
+    module: ModuleType,
+    collected: List[Type[ExpotionPlugin]]
+) -> List[Type[ExpotionPlugin]]:
+    """
+    Отбирает классы плагинов модуля.
+    
+    Берутся наследники, объявленные при исполнении модуля в нём самом или
+    в его подмодулях. Если таких нет (класс импортирован из уже загруженного
+    пакета), просматривается пространство имён модуля. Классы, от которых
+    унаследован другой найденный класс, считаются базовыми и пропускаются.
+    """
+    prefix = module.__name__ + "."
+    classes = [
+        cls for cls in collected
+        if cls.__module__ == module.__name__ or cls.__module__.startswith(prefix)
+    ]
+    if not classes:
+        classes = [
+            obj for obj in vars(module).values()
+            if isinstance(obj, type)
+            and issubclass(obj, ExpotionPlugin)
+            and obj is not ExpotionPlugin
+        ]
+    concrete = [
+        cls for cls in dict.fromkeys(classes)
+        if not inspect.isabstract(cls)
+    ]
+    return [
+        cls for cls in concrete
+        if not any(other is not cls and issubclass(other, cls) for other in concrete)
+    ]
+
+
+def _import_local_plugin(
+    module_name: str,
+    module_path: str,
+    package_path: Optional[str] = None
+) -> List[Type[ExpotionPlugin]]:
+    """
+    Импортирует модуль локального плагина и возвращает объявленные в нём классы.
+    
+    Модуль регистрируется в sys.modules; если этот же файл уже импортирован,
+    повторно он не исполняется. Если имя занято модулем из другого файла,
+    к имени добавляется суффикс, производный от пути.
+    """
+    module_path = os.path.realpath(module_path)
+    
+    with _local_plugins_lock:
+        cached = _local_plugin_modules.get(module_path)
+        if cached is not None and _module_file(sys.modules.get(cached[0])) == module_path:
+            return cached[1]
+        
+        existing = _module_file(sys.modules.get(module_name))
+        if existing == module_path:
+            plugin_classes = _find_plugin_classes(sys.modules[module_name], [])
+            _local_plugin_modules[module_path] = (module_name, plugin_classes)
+            return plugin_classes
+        if existing is not None:
+            module_name = f"{module_name}_{zlib.crc32(module_path.encode()):08x}"
+        
+        spec = importlib.util.spec_from_file_location(
+            module_name,
+            module_path,
+            submodule_search_locations=[package_path] if package_path else None
+        )
+        if not spec or not spec.loader:
+            return []
+        
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            with _collect_subclasses() as collected:
+                spec.loader.exec_module(module)
+        except BaseException:
+            sys.modules.pop(module_name, None)
+            raise
+        
+        plugin_classes = _find_plugin_classes(module, collected)
+        _local_plugin_modules[module_path] = (module_name, plugin_classes)
+        return plugin_classes
+
+
+def _start_healthcheck(check: Callable[[], Dict[str, Any]]) -> Future:
+    """
+    Запускает проверку в daemon-потоке и возвращает Future с её результатом.
+    
+    Проверка выполняется в копии текущего контекста, поэтому current_app
+    и другие контекстные переменные остаются доступны.
+    """
+    future: Future = Future()
+    context = contextvars.copy_context()
+    
+    def run() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = context.run(check)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+    
+    threading.Thread(target=run, name="expotion-healthcheck", daemon=True).start()
+    return future
 
 
 class PluginLoader:
@@ -31,8 +171,18 @@ class PluginLoader:
     ):
         self._app = app
         self._plugins: Dict[str, ExpotionPlugin] = {}
-        self._plugins_dir = plugins_dir
-        self._disabled_plugins: List[str] = []
+        self._plugins_view = MappingProxyType(self._plugins)
+        self._plugins_dir: Optional[Path] = Path(plugins_dir) if plugins_dir else None
+        self._disabled_plugins: FrozenSet[str] = frozenset()
+        self._active_cache: Optional[Tuple[ExpotionPlugin, ...]] = None
+        self._menu_cache: Optional[Tuple[Dict[str, str], ...]] = None
+        self._context_cache: Optional[Dict[str, Any]] = None
+        self._cache_lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._scanned = False
+        self._loaded = False
+        self._healthcheck_lock = threading.Lock()
+        self._healthcheck_futures: Dict[str, Future] = {}
         
         if app is not None:
             self.init_app(app)
@@ -41,50 +191,66 @@ class PluginLoader:
         """Инициализирует загрузчик с Flask приложением."""
         self._app = app
         
-        app.extensions = getattr(app, 'extensions', {})
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
         app.extensions['expotion_loader'] = self
         
-        self._disabled_plugins = app.config.get('DISABLED_PLUGINS', [])
+        self._disabled_plugins = frozenset(app.config.get('DISABLED_PLUGINS', ()))
         
         if self._plugins_dir is None:
-            self._plugins_dir = app.config.get('PLUGINS_DIR')
+            plugins_dir = app.config.get('PLUGINS_DIR')
+            self._plugins_dir = Path(plugins_dir) if plugins_dir else None
         
         @app.context_processor
         def inject_plugins():
-            return {
-                'expotion_plugins': self.get_all_plugins(),
-                'expotion_menu_items': self.get_all_menu_items()
-            }
+            payload = self._context_cache
+            if payload is None:
+                with self._cache_lock:
+                    if self._context_cache is None:
+                        self._context_cache = {
+                            'expotion_plugins': self.get_all_plugins(),
+                            'expotion_menu_items': self.get_all_menu_items()
+                        }
+                    payload = self._context_cache
+            return payload
     
     @property
-    def plugins(self) -> Dict[str, ExpotionPlugin]:
-        """Возвращает словарь всех загруженных плагинов."""
-        return self._plugins.copy()
+    def plugins(self) -> Mapping[str, ExpotionPlugin]:
+        """Возвращает словарь всех загруженных плагинов (только для чтения)."""
+        return self._plugins_view
     
     def load_all(self) -> None:
-        """Загружает все плагины."""
-        logger.info("🔌 Expotion: Загрузка плагинов...")
-        
-        self._load_from_entry_points()
-        
-        if self._plugins_dir:
-            self._load_from_directory()
-        
-        self._init_all_plugins()
+        """
+        Загружает все плагины.
         
-        logger.info(f"✅ Expotion: Загружено плагинов: {len(self._plugins)}")
+        Источники плагинов сканируются один раз, а плагины инициализируются
+        один раз после привязки к Flask приложению: повторные и параллельные
+        вызовы не повторяют уже выполненную работу.
+        """
+        with self._load_lock:
+            if self._loaded:
+                return
+            
+            logger.info("🔌 Expotion: Загрузка плагинов...")
+            
+            if not self._scanned:
+                self._load_from_entry_points()
+                
+                if self._plugins_dir is not None:
+                    self._load_from_directory()
+                
+                self._scanned = True
+            
+            if self._app is not None:
+                self._init_all_plugins()
+                self._loaded = True
+            
+            logger.info(f"✅ Expotion: Загружено плагинов: {len(self._plugins)}")
     
     def _load_from_entry_points(self) -> None:
         """Загружает плагины из entry points."""
         try:
-            entry_points = importlib.metadata.entry_points()
-            
-            if hasattr(entry_points, 'select'):
-                eps = entry_points.select(group=ENTRY_POINT_GROUP)
-            else:
-                eps = entry_points.get(ENTRY_POINT_GROUP, [])
-            
-            for ep in eps:
+            for ep in _cached_entry_points():
                 try:
                     plugin_class = ep.load()
                     self._register_plugin_class(plugin_class, source=f"pip:{ep.name}")
@@ -96,46 +262,48 @@ class PluginLoader:
     
     def _load_from_directory(self) -> None:
         """Загружает плагины из локальной директории."""
-        if not self._plugins_dir or not Path(self._plugins_dir).exists():
+        if self._plugins_dir is None:
             return
         
-        plugins_path = Path(self._plugins_dir)
+        try:
+            with os.scandir(self._plugins_dir) as entries:
+                plugin_dirs = [
+                    entry for entry in entries
+                    if entry.is_dir() and entry.name[:1] not in ('_', '.')
+                ]
+        except (FileNotFoundError, NotADirectoryError):
+            return
         
-        for plugin_path in plugins_path.iterdir():
-            if not plugin_path.is_dir():
-                continue
-            if plugin_path.name.startswith('_') or plugin_path.name.startswith('.'):
-                continue
-            
-            plugin_module = plugin_path / "plugin.py"
-            if not plugin_module.exists():
-                plugin_module = plugin_path / "__init__.py"
-            
-            if not plugin_module.exists():
-                continue
+        for entry in plugin_dirs:
+            package_path = None
+            plugin_module = os.path.join(entry.path, "plugin.py")
+            try:
+                os.stat(plugin_module)
+            except OSError:
+                plugin_module = os.path.join(entry.path, "__init__.py")
+                package_path = entry.path
+                try:
+                    os.stat(plugin_module)
+                except OSError:
+                    continue
             
             try:
-                spec = importlib.util.spec_from_file_location(
-                    f"plugins.{plugin_path.name}",
-                    plugin_module
+                plugin_classes = _import_local_plugin(
+                    f"plugins.{entry.name}",
+                    plugin_module,
+                    package_path=package_path
                 )
-                if spec and spec.loader:
-                    module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(module)
+                if not plugin_classes:
+                    logger.warning(f"⚠️ В {plugin_module} не найден класс плагина")
+                
+                for plugin_class in plugin_classes:
+                    self._register_plugin_class(
+                        plugin_class, 
+                        source=f"local:{entry.name}"
+                    )
                     
-                    for attr_name in dir(module):
-                        attr = getattr(module, attr_name)
-                        if (isinstance(attr, type) 
-                            and issubclass(attr, ExpotionPlugin) 
-                            and attr is not ExpotionPlugin):
-                            self._register_plugin_class(
-                                attr, 
-                                source=f"local:{plugin_path.name}"
-                            )
-                            break
-                            
             except Exception as e:
-                logger.error(f"❌ Ошибка загрузки плагина {plugin_path.name}: {e}")
+                logger.error(f"❌ Ошибка загрузки плагина {entry.name}: {e}")
     
     def _register_plugin_class(
         self, 
@@ -144,18 +312,21 @@ class PluginLoader:
     ) -> None:
         """Регистрирует класс плагина."""
         try:
-            plugin = plugin_class()
+            name = getattr(plugin_class, 'name', None)
             
-            if plugin.name in self._disabled_plugins:
-                logger.info(f"⏸️ Плагин {plugin.name} отключен")
+            if name in self._disabled_plugins:
+                logger.info(f"⏸️ Плагин {name} отключен")
                 return
             
-            if plugin.name in self._plugins:
-                logger.warning(f"⚠️ Плагин {plugin.name} уже загружен")
+            if name in self._plugins:
+                logger.warning(f"⚠️ Плагин {name} уже загружен")
                 return
             
+            plugin = plugin_class()
             plugin.on_load()
-            self._plugins[plugin.name] = plugin
+            with self._cache_lock:
+                self._plugins[plugin.name] = plugin
+                self._invalidate_cache()
             logger.info(f"📦 Загружен: {plugin.name} v{plugin.version} [{source}]")
             
         except Exception as e:
@@ -176,50 +347,142 @@ class PluginLoader:
             except Exception as e:
                 logger.error(f"❌ Ошибка инициализации {plugin.name}: {e}")
                 plugin._enabled = False
+        
+        self._invalidate_cache()
     
     def _sort_by_dependencies(self) -> List[ExpotionPlugin]:
-        """Сортирует плагины по зависимостям."""
-        result = []
-        visited = set()
+        """
+        Сортирует плагины по зависимостям.
         
-        def visit(name: str):
-            if name in visited:
-                return
-            visited.add(name)
+        Глубина каждого плагина (длина самой длинной цепочки зависимостей)
+        считается одним проходом алгоритма Кана; плагины упорядочиваются
+        по глубине, а при равенстве — по порядку загрузки. Если зависимости
+        образуют цикл, первым размещается входящий в цикл плагин с наименьшим
+        числом неразрешённых зависимостей.
+        """
+        indegree = {name: 0 for name in self._plugins}
+        children: Dict[str, List[str]] = {name: [] for name in self._plugins}
+        
+        for name, plugin in self._plugins.items():
+            for dep in plugin.dependencies:
+                if dep in self._plugins:
+                    indegree[name] += 1
+                    children[dep].append(name)
+        
+        queue = deque(name for name, degree in indegree.items() if degree == 0)
+        unplaced = dict.fromkeys(self._plugins)
+        depth = dict.fromkeys(self._plugins, 0)
+        
+        while unplaced:
+            if not queue:
+                cycle = self._find_cycle(unplaced)
+                logger.warning(
+                    f"⚠️ Циклическая зависимость: {' -> '.join(cycle + cycle[:1])}"
+                )
+                queue.append(min(cycle, key=indegree.__getitem__))
             
-            plugin = self._plugins.get(name)
-            if plugin:
-                for dep in plugin.dependencies:
-                    if dep in self._plugins:
-                        visit(dep)
-                result.append(plugin)
+            name = queue.popleft()
+            del unplaced[name]
+            
+            for child in children[name]:
+                if child not in unplaced:
+                    continue
+                indegree[child] -= 1
+                depth[child] = max(depth[child], depth[name] + 1)
+                if indegree[child] == 0:
+                    queue.append(child)
         
-        for name in self._plugins:
-            visit(name)
+        return sorted(self._plugins.values(), key=lambda p: depth[p.name])
+    
+    def _find_cycle(self, unplaced: Dict[str, None]) -> List[str]:
+        """
+        Находит цикл среди неразмещённых плагинов.
         
-        return result
+        У каждого неразмещённого плагина есть неразмещённая зависимость,
+        поэтому переход по ним обязательно приводит в цикл.
+        """
+        path: List[str] = []
+        position: Dict[str, int] = {}
+        name = next(iter(unplaced))
+        while name not in position:
+            position[name] = len(path)
+            path.append(name)
+            name = next(
+                dep for dep in self._plugins[name].dependencies if dep in unplaced
+            )
+        return path[position[name]:]
     
     def get_plugin(self, name: str) -> Optional[ExpotionPlugin]:
         """Возвращает плагин по имени."""
         return self._plugins.get(name)
     
-    def get_all_plugins(self) -> List[ExpotionPlugin]:
-        """Возвращает список всех активных плагинов."""
-        return [p for p in self._plugins.values() if p.enabled]
+    def get_all_plugins(self) -> Tuple[ExpotionPlugin, ...]:
+        """Возвращает кортеж всех активных плагинов (кешируется)."""
+        active = self._active_cache
+        if active is None:
+            with self._cache_lock:
+                if self._active_cache is None:
+                    self._active_cache = tuple(
+                        p for p in self._plugins.values() if p.enabled
+                    )
+                active = self._active_cache
+        return active
     
-    def get_all_menu_items(self) -> List[Dict[str, str]]:
-        """Собирает пункты меню со всех плагинов."""
-        items = []
-        for plugin in self.get_all_plugins():
-            items.extend(plugin.get_menu_items())
-        return items
+    def get_all_menu_items(self) -> Tuple[Dict[str, str], ...]:
+        """Собирает пункты меню со всех плагинов (кешируется)."""
+        menu_items = self._menu_cache
+        if menu_items is None:
+            with self._cache_lock:
+                if self._menu_cache is None:
+                    self._menu_cache = tuple(chain.from_iterable(
+                        plugin.get_menu_items() for plugin in self.get_all_plugins()
+                    ))
+                menu_items = self._menu_cache
+        return menu_items
     
-    def healthcheck(self) -> Dict[str, Any]:
-        """Проверка состояния всех плагинов."""
+    def _invalidate_cache(self) -> None:
+        """
+        Сбрасывает кеш активных плагинов, пунктов меню и контекста шаблонов.
+        
+        Кеши строятся под той же блокировкой, поэтому сборка, начатая до
+        сброса, не может сохранить устаревшее значение после него.
+        """
+        with self._cache_lock:
+            self._active_cache = None
+            self._menu_cache = None
+            self._context_cache = None
+    
+    def healthcheck(self, timeout: float = HEALTHCHECK_TIMEOUT) -> Dict[str, Any]:
+        """
+        Проверка состояния всех плагинов.
+        
+        Каждая проверка выполняется в отдельном фоновом (daemon) потоке;
+        плагины, не ответившие за timeout секунд, получают статус ошибки.
+        Проверка, не уложившаяся в timeout, продолжает выполняться в фоне
+        и не задерживает завершение процесса. Пока она не закончилась,
+        новая проверка для этого плагина не запускается.
+        """
+        if not self._plugins:
+            return {}
+        
+        with self._healthcheck_lock:
+            futures = {}
+            for name, plugin in self._plugins.items():
+                future = self._healthcheck_futures.get(name)
+                if future is None or future.done():
+                    future = _start_healthcheck(plugin.healthcheck)
+                futures[name] = future
+            self._healthcheck_futures = futures
+        
+        _, not_done = wait(futures.values(), timeout=timeout)
+        
         results = {}
-        for name, plugin in self._plugins.items():
+        for name, future in futures.items():
+            if future in not_done:
+                results[name] = {"status": "error", "message": "timeout"}
+                continue
             try:
-                results[name] = plugin.healthcheck()
+                results[name] = future.result()
             except Exception as e:
                 results[name] = {"status": "error", "message": str(e)}
         return results
@@ -231,7 +494,9 @@ class PluginLoader:
             try:
                 plugin.on_unload()
                 plugin._enabled = False
-                del self._plugins[name]
+                with self._cache_lock:
+                    del self._plugins[name]
+                    self._invalidate_cache()
                 logger.info(f"🔌 Плагин {name} выгружен")
                 return True
             except Exception as e:
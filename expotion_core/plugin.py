@@ -2,12 +2,32 @@
 Базовый класс плагина для Expotion.
 """
 from abc import ABC, abstractmethod
-from typing import Optional, List, Dict, Any
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, List, Dict, Any, Iterator, Sequence, Type
 from pathlib import Path
 
 from flask import Flask
 
 
+# Список, в который записываются объявляемые наследники ExpotionPlugin.
+# Задаётся загрузчиком только на время исполнения модуля плагина.
+_subclass_collector: ContextVar[Optional[List[Type["ExpotionPlugin"]]]] = ContextVar(
+    "expotion_subclass_collector", default=None
+)
+
+
+@contextmanager
+def _collect_subclasses() -> Iterator[List[Type["ExpotionPlugin"]]]:
+    """Собирает наследников ExpotionPlugin, объявленных внутри блока."""
+    collected: List[Type["ExpotionPlugin"]] = []
+    token = _subclass_collector.set(collected)
+    try:
+        yield collected
+    finally:
+        _subclass_collector.reset(token)
+
+
 class ExpotionPlugin(ABC):
     """
     Базовый абстрактный класс для всех Expotion плагинов.
@@ -19,15 +39,26 @@ class ExpotionPlugin(ABC):
         author: Автор плагина
         dependencies: Список зависимостей от других плагинов
         default_config: Настройки по умолчанию
+    
+    Состояние экземпляра хранится в __slots__. Наследники без собственных
+    __slots__ получают обычный __dict__ и могут заводить любые атрибуты.
     """
     
+    __slots__ = ('_app', '_enabled', '_base_path')
+    
     name: str = "base-plugin"
     version: str = "0.0.0"
     description: str = "Base plugin"
     author: str = ""
-    dependencies: List[str] = []
+    dependencies: Sequence[str] = ()
     default_config: Dict[str, Any] = {}
     
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        collected = _subclass_collector.get()
+        if collected is not None:
+            collected.append(cls)
+    
     def __init__(self):
         self._app: Optional[Flask] = None
         self._enabled: bool = True